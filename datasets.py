@@ -4,13 +4,18 @@ Extract used datasets from papers using Claude Agent SDK.
 """
 
 import os
+import io
 import asyncio
-from pathlib import Path
+import functools
 from claude_agent_sdk import query, ClaudeAgentOptions
 
 # Reduced limit to avoid crashing the SDK bridge
-MAX_CHARS_PER_PAPER = 25000 
+MAX_CHARS_PER_PAPER = 25000
 
+# Max parallel Claude queries (PAPERS_CONCURRENCY)
+MAX_CONCURRENT_QUERIES = max(1, int(os.getenv("PAPERS_CONCURRENCY", "8")))
+
+@functools.lru_cache(maxsize=8192)
 def get_weighted_score(filename):
     """
     Return a priority score for sorting files. Lower is better.
@@ -34,55 +39,60 @@ def get_paper_content(papers_dir):
     Prioritizes important sections and limits total length.
     """
     papers_content = []
-    papers_path = Path(papers_dir)
-
-    for paper_dir in sorted(papers_path.iterdir()):
-        if paper_dir.is_dir():
-            paper_text_parts = []
-            
-            # Get all text files and sort them by priority
-            all_files = list(paper_dir.glob("*.txt"))
-            # Sort by priority score, then by name for stability
-            sorted_files = sorted(all_files, key=lambda p: (get_weighted_score(p.name), p.name))
-            
-            current_length = 0
-            
-            for text_file in sorted_files:
-                # Skip references
-                if "reference" in text_file.name.lower():
-                    continue
-                
-                try:
-                    with open(text_file, 'r', encoding='utf-8') as f:
-                        content = f.read().strip()
-                        if content:
-                            # If adding this file exceeds limit significantly, skip it or truncate
-                            # We allow a little overflow if it's the first file, otherwise check
-                            if current_length > MAX_CHARS_PER_PAPER:
-                                break
-                            
-                            header = f"\n--- Section: {text_file.stem} ---\n"
-                            
-                            # Truncate content if needed to just fit the remainder?
-                            # For simplicity, we just add files until we hit the cap.
-                            # If a single file is huge, we truncate it.
-                            max_chunk = MAX_CHARS_PER_PAPER - current_length
-                            if len(content) > max_chunk:
-                                content = content[:max_chunk] + "\n[... truncated ...]"
-                            
-                            paper_text_parts.append(header + content)
-                            current_length += len(header) + len(content)
-                            
-                except Exception as e:
-                    print(f"Warning: Could not read {text_file}: {e}")
-
-            if paper_text_parts:
-                paper_id = paper_dir.name.replace("_sections", "")
-                full_text = "".join(paper_text_parts)
-                papers_content.append({
-                    "paper_id": paper_id,
-                    "content": full_text
-                })
+
+    # Paper directories in name order
+    with os.scandir(papers_dir) as it:
+        paper_dirs = sorted((e for e in it if e.is_dir()), key=lambda e: e.name)
+
+    for paper_dir in paper_dirs:
+        paper_text = io.StringIO()
+        
+        # Get all text files, skipping references up front so each
+        # filename is only lowercased once
+        with os.scandir(paper_dir) as it:
+            all_files = [e for e in it
+                         if e.is_file() and e.name.endswith(".txt")
+                         and "reference" not in e.name.lower()]
+        # Sort by priority score, then by name for stability
+        sorted_files = sorted(all_files, key=lambda e: (get_weighted_score(e.name), e.name))
+
+        current_length = 0
+
+        for text_file in sorted_files:
+            try:
+                # Read raw bytes and decode once instead of going through TextIOWrapper;
+                # normalize CRLF by hand since binary mode skips newline translation
+                with open(text_file.path, 'rb') as f:
+                    content = f.read().decode('utf-8').replace('\r\n', '\n').strip()
+                    if content:
+                        # If adding this file exceeds limit significantly, skip it or truncate
+                        # We allow a little overflow if it's the first file, otherwise check
+                        if current_length > MAX_CHARS_PER_PAPER:
+                            break
+                        
+                        header = f"\n--- Section: {os.path.splitext(text_file.name)[0]} ---\n"
+                        
+                        # Truncate content if needed to just fit the remainder?
+                        # For simplicity, we just add files until we hit the cap.
+                        # If a single file is huge, we truncate it.
+                        max_chunk = MAX_CHARS_PER_PAPER - current_length
+                        if len(content) > max_chunk:
+                            content = content[:max_chunk] + "\n[... truncated ...]"
+                        
+                        paper_text.write(header)
+                        paper_text.write(content)
+                        current_length += len(header) + len(content)
+                        
+            except Exception as e:
+                print(f"Warning: Could not read {text_file.path}: {e}")
+
+        if current_length:
+            paper_id = paper_dir.name.replace("_sections", "")
+            full_text = paper_text.getvalue()
+            papers_content.append({
+                "paper_id": paper_id,
+                "content": full_text
+            })
 
     return papers_content
 
@@ -99,55 +109,61 @@ Output your answer as a concise bulleted list. If no datasets are clearly used,
         model='haiku'  # Use haiku for faster, cheaper processing
     )
 
-    results = []
+    sem = asyncio.Semaphore(MAX_CONCURRENT_QUERIES)
 
-    for i, paper_info in enumerate(papers, 1):
+    async def process(i, paper_info):
         paper_id = paper_info["paper_id"]
         content = paper_info["content"]
 
-        print(f"Processing {i}/{len(papers)}: {paper_id}")
-        print(f"  > Content length: {len(content)} chars")
+        async with sem:
+            print(f"Processing {i}/{len(papers)}: {paper_id}")
+            print(f"  > Content length: {len(content)} chars")
 
-        try:
-            prompt = f"""Identify the datasets used in this paper based on the following content:
+            try:
+                prompt = f"""Identify the datasets used in this paper based on the following content:
 
 {content}
 
 Used Datasets:"""
 
-            # Query Claude
-            response_text = ""
-            async for message in query(prompt=prompt, options=options):
-                if hasattr(message, 'content'):
-                    for block in message.content:
-                        if hasattr(block, 'text'):
-                            response_text += block.text
+                # Query Claude
+                response_text = ""
+                async for message in query(prompt=prompt, options=options):
+                    if hasattr(message, 'content'):
+                        for block in message.content:
+                            if hasattr(block, 'text'):
+                                response_text += block.text
 
-            response_text = response_text.strip()
+                response_text = response_text.strip()
 
-            results.append({
-                "paper_id": paper_id,
-                "datasets": response_text
-            })
+                print(f"  [OK] {paper_id}: {response_text[:80].replace(chr(10), ' ')}...")
 
-            print(f"  [OK] Found: {response_text[:80].replace(chr(10), ' ')}...")
-            
-            # Small delay to prevent overwhelming the local bridge
-            await asyncio.sleep(1.0)
+                return {
+                    "paper_id": paper_id,
+                    "datasets": response_text
+                }
 
-        except Exception as e:
-            print(f"  [ERROR] {e}")
-            results.append({
-                "paper_id": paper_id,
-                "datasets": f"ERROR: {str(e)}"
-            })
+            except Exception as e:
+                print(f"  [ERROR] {paper_id}: {e}")
+                return {
+                    "paper_id": paper_id,
+                    "datasets": f"ERROR: {str(e)}"
+                }
 
-    # Save results to text file
+    # Start papers in order and write each result as soon as every earlier paper is written,
+    # so the file stays in paper order and a crash keeps a finished prefix
+    results = []
     with open(output_file, 'w', encoding='utf-8') as f:
-        for result in results:
-            f.write(f"Paper: {result['paper_id']}\n")
-            f.write(f"Datasets:\n{result['datasets']}\n")
-            f.write("-" * 80 + "\n\n")
+        tasks = [asyncio.create_task(process(i, p)) for i, p in enumerate(papers, 1)]
+        for next_result in asyncio.as_completed(tasks):
+            await next_result
+            while len(results) < len(tasks) and tasks[len(results)].done():
+                result = tasks[len(results)].result()
+                results.append(result)
+                f.write(f"Paper: {result['paper_id']}\n")
+                f.write(f"Datasets:\n{result['datasets']}\n")
+                f.write("-" * 80 + "\n\n")
+            f.flush()
 
     print(f"\n[OK] Results saved to {output_file}")
 
@@ -5,24 +5,36 @@ Extract main ideas from paper abstracts using Claude Agent SDK.
 
 import os
 import asyncio
-from pathlib import Path
 from claude_agent_sdk import query, ClaudeAgentOptions
 
+# Queries in flight, override with PAPERS_CONCURRENCY
+MAX_CONCURRENT_QUERIES = max(1, int(os.getenv("PAPERS_CONCURRENCY", "8")))
+
+def find_abstract_file(paper_dir):
+    """Return the path of the first 0b_*.txt section in paper_dir, or None."""
+    with os.scandir(paper_dir) as it:
+        for entry in it:
+            if entry.name.startswith("0b_") and entry.name.endswith(".txt") and entry.is_file():
+                return entry.path
+    return None
+
 def find_abstract_files(papers_dir):
     """Find all abstract files in paper_sections directory."""
     abstracts = []
-    papers_path = Path(papers_dir)
-
-    for paper_dir in sorted(papers_path.iterdir()):
-        if paper_dir.is_dir():
-            # Look for abstract file (could be Abstract.txt or ABSTRACT.txt)
-            abstract_files = list(paper_dir.glob("0b_*.txt"))
-            if abstract_files:
-                paper_id = paper_dir.name.replace("_sections", "")
-                abstracts.append({
-                    "paper_id": paper_id,
-                    "abstract_file": abstract_files[0]
-                })
+
+    # Sorted paper directories
+    with os.scandir(papers_dir) as it:
+        paper_dirs = sorted((e for e in it if e.is_dir()), key=lambda e: e.name)
+
+    for paper_dir in paper_dirs:
+        # Look for abstract file (could be Abstract.txt or ABSTRACT.txt)
+        abstract_file = find_abstract_file(paper_dir)
+        if abstract_file:
+            paper_id = paper_dir.name.replace("_sections", "")
+            abstracts.append({
+                "paper_id": paper_id,
+                "abstract_file": abstract_file
+            })
 
     return abstracts
 
@@ -38,57 +50,66 @@ Keep your response concise - just the main idea, no extra commentary.''',
         model='haiku'  # Use haiku for faster, cheaper processing
     )
 
-    results = []
+    sem = asyncio.Semaphore(MAX_CONCURRENT_QUERIES)
 
-    for i, paper_info in enumerate(abstracts, 1):
+    async def process(i, paper_info):
         paper_id = paper_info["paper_id"]
         abstract_file = paper_info["abstract_file"]
 
-        print(f"Processing {i}/{len(abstracts)}: {paper_id}")
+        async with sem:
+            print(f"Processing {i}/{len(abstracts)}: {paper_id}")
 
-        try:
-            # Read the abstract
-            with open(abstract_file, 'r', encoding='utf-8') as f:
-                abstract_text = f.read().strip()
+            try:
+                # Read the abstract
+                with open(abstract_file, 'r', encoding='utf-8') as f:
+                    abstract_text = f.read().strip()
 
-            # Create the prompt
-            prompt = f"""Extract the main idea from this paper abstract in ONE clear sentence:
+                # Create the prompt
+                prompt = f"""Extract the main idea from this paper abstract in ONE clear sentence:
 
 {abstract_text}
 
 Main idea:"""
 
-            # Query Claude using the simple query function
-            main_idea = ""
-            async for message in query(prompt=prompt, options=options):
-                # Extract text from message content blocks
-                if hasattr(message, 'content'):
-                    for block in message.content:
-                        if hasattr(block, 'text'):
-                            main_idea += block.text
+                # Query Claude using the simple query function
+                main_idea = ""
+                async for message in query(prompt=prompt, options=options):
+                    # Extract text from message content blocks
+                    if hasattr(message, 'content'):
+                        for block in message.content:
+                            if hasattr(block, 'text'):
+                                main_idea += block.text
 
-            main_idea = main_idea.strip()
+                main_idea = main_idea.strip()
 
-            results.append({
-                "paper_id": paper_id,
-                "main_idea": main_idea
-            })
+                print(f"  [OK] {paper_id}: {main_idea[:80]}...")
 
-            print(f"  [OK] Extracted: {main_idea[:80]}...")
+                return {
+                    "paper_id": paper_id,
+                    "main_idea": main_idea
+                }
 
-        except Exception as e:
-            print(f"  [ERROR] {e}")
-            results.append({
-                "paper_id": paper_id,
-                "main_idea": f"ERROR: {str(e)}"
-            })
+            except Exception as e:
+                print(f"  [ERROR] {paper_id}: {e}")
+                return {
+                    "paper_id": paper_id,
+                    "main_idea": f"ERROR: {str(e)}"
+                }
 
-    # Save results to text file
+    # Start papers in order and save main ideas as soon as every earlier paper is saved,
+    # so the file stays in paper order and a crash keeps a finished prefix
+    results = []
     with open(output_file, 'w', encoding='utf-8') as f:
-        for result in results:
-            f.write(f"Paper: {result['paper_id']}\n")
-            f.write(f"Main Idea: {result['main_idea']}\n")
-            f.write("-" * 80 + "\n\n")
+        tasks = [asyncio.create_task(process(i, p)) for i, p in enumerate(abstracts, 1)]
+        for next_result in asyncio.as_completed(tasks):
+            await next_result
+            while len(results) < len(tasks) and tasks[len(results)].done():
+                result = tasks[len(results)].result()
+                results.append(result)
+                f.write(f"Paper: {result['paper_id']}\n"
+                        f"Main Idea: {result['main_idea']}\n"
+                        + "-" * 80 + "\n\n")
+            f.flush()
 
     print(f"\n[OK] Results saved to {output_file}")
 
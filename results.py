@@ -4,13 +4,68 @@ Extract experimental results and tables from paper sections using Claude Agent S
 """
 
 import os
+import re
+import random
 import asyncio
+import argparse
+import hashlib
+import functools
 from pathlib import Path
 from claude_agent_sdk import query, ClaudeAgentOptions
 
 # Limit to avoid overloading context
 MAX_CHARS_PER_PAPER = 25000
 
+SYSTEM_PROMPT = '''You are an expert researcher tasked with extracting experimental results from scientific papers.
+Your goal is to ONE THING ONLY: Extract tables containing experimental results.
+
+Instructions:
+1.  **Output ONLY the tables.** Do not include any introductory text, explanations, or conclusions.
+2.  Format specific tables as Markdown tables.
+3.  If a result is presented as a list of key metrics instead of a table, format it as a table with columns "Metric" and "Value".
+4.  If no experimental results are found, output the string "NO_RESULTS_FOUND".
+5.  Do not output "Here are the results..." or "Based on the paper...". Start directly with the Markdown table.
+'''
+
+# Sections that definitely don't have detailed results tables
+SKIP_SECTION_RE = re.compile(r"references|acknowledgment|related work", re.IGNORECASE)
+
+# Sections scoring at or below this (results, comparisons, methods) get their own query
+SECTION_QUERY_MAX_SCORE = 2
+# Per-paper limit on concurrent section queries
+SECTION_CONCURRENCY = 4
+
+# Retry settings for transient query failures
+MAX_RETRIES = 6
+RETRY_MIN_DELAY = 1.0
+RETRY_MAX_DELAY = 60.0
+
+# Error text that marks a failure as rate limiting, or as worth retrying at all
+RATE_LIMIT_RE = re.compile(r"rate.?limit|\b429\b|overloaded|\b529\b|usage limit", re.IGNORECASE)
+TRANSIENT_ERROR_RE = re.compile(
+    r"Claude Code not found|rate.?limit|(?:status|error|code)[ :]*(?:429|5\d\d)\b|overloaded|usage limit"
+    r"|timed? ?out|connection ?(?:error|reset|refused)",
+    re.IGNORECASE,
+)
+# Replies that are really rate-limit notices rather than extracted tables
+RATE_LIMIT_REPLY_RE = re.compile(r"(API Error: (429|529)|Claude AI usage limit reached)", re.IGNORECASE)
+
+# Per-paper cache of the assembled section text. No .txt suffix, so the
+# section globs in this and the other scripts never pick it up
+CONTENT_CACHE_PREFIX = ".content_cache_"
+# Bump whenever get_paper_content changes how content is assembled, so old caches are ignored
+CONTENT_CACHE_VERSION = 3
+
+# Fixed instructions placed ahead of the paper content in every user prompt
+RESULTS_INSTRUCTIONS = """Find and format all experimental result tables from the paper content below.
+Preserve the exact numbers."""
+
+# Message Batches settings (used with --batch)
+BATCH_MODEL = "claude-sonnet-4-20250514"
+BATCH_MAX_TOKENS = 4096
+BATCH_POLL_SECONDS = 30
+
+@functools.lru_cache(maxsize=8192)
 def get_weighted_score(filename):
     """
     Return a priority score for sorting files. Lower is better.
@@ -29,50 +84,113 @@ def get_weighted_score(filename):
         return 4
     return 10
 
-def get_paper_content(paper_dir):
+def list_section_files(paper_dir):
+    """Return the relevant section files of a paper directory, most relevant first."""
+    # One directory scan; skip files that definitely don't have detailed
+    # results tables before they are scored, fingerprinted or opened
+    with os.scandir(paper_dir) as it:
+        all_files = [e for e in it
+                     if e.name.endswith(".txt") and e.is_file() and not SKIP_SECTION_RE.search(e.name)]
+    # Sort: Primary sort by content relevance, secondary by name
+    return sorted(all_files, key=lambda e: (get_weighted_score(e.name), e.name))
+
+def iter_sections(entries):
+    """
+    Yield (section_name, text) for each non-empty section file in entries.
+    Each section is capped at MAX_CHARS_PER_PAPER on its own.
+    """
+    for entry in entries:
+        try:
+            text = Path(entry.path).read_text(encoding='utf-8', errors='replace').strip()
+        except Exception as e:
+            print(f"  [WARN] Could not read {entry.name}: {e}")
+            continue
+
+        if not text:
+            continue
+        if len(text) > MAX_CHARS_PER_PAPER:
+            text = text[:MAX_CHARS_PER_PAPER] + "\n[... truncated ...]"
+
+        yield os.path.splitext(entry.name)[0], text
+
+def get_paper_content(paper_dir, sorted_files=None, cache_tag="all"):
     """
     Read and concatenate all relevant text files from a paper directory.
     Excludes metdata, prioritizes result sections, and enforces length limit.
+    Pass sorted_files to build the content from a subset of the section files,
+    with a cache_tag naming that subset so its cache is kept apart from the others.
     """
     content_parts = []
     paper_path = Path(paper_dir)
-    
-    # Get all potential text files
-    all_files = list(paper_path.glob("*.txt"))
-    # Sort: Primary sort by content relevance, secondary by name
-    sorted_files = sorted(all_files, key=lambda p: (get_weighted_score(p.name), p.name))
-    
+    if sorted_files is None:
+        sorted_files = list_section_files(paper_path)
+
+    # Reuse the content built on a previous run if no section file changed
+    cache_file = paper_path / f"{CONTENT_CACHE_PREFIX}{cache_tag}_{content_cache_key(sorted_files)}"
+    if cache_file.is_file():
+        try:
+            return cache_file.read_text(encoding='utf-8')
+        except Exception as e:
+            print(f"  [WARN] Could not read cache {cache_file.name}: {e}")
+
     current_length = 0
-    
-    for file_path in sorted_files:
-        filename = file_path.name
-        
-        # Skip specific files that definitely don't have detailed results tables
-        if any(x in filename.lower() for x in ['references', 'acknowledgment', 'related work']):
-            continue
-            
+    read_failed = False
+
+    for entry in sorted_files:
+        filename = entry.name
+
         try:
-            with open(file_path, 'r', encoding='utf-8') as f:
-                text = f.read().strip()
-                if text:
-                    # Check limit
-                    if current_length > MAX_CHARS_PER_PAPER:
-                        break
-                        
-                    header = f"\n--- Section: {filename} ---\n"
-                    
-                    # Truncate if this file pushes over the edge
-                    remaining_space = MAX_CHARS_PER_PAPER - current_length
-                    if len(text) > remaining_space:
-                        text = text[:remaining_space] + "\n[... truncated ...]"
-                    
-                    content_parts.append(header + text)
-                    current_length += len(header) + len(text)
-                    
+            text = Path(entry.path).read_text(encoding='utf-8', errors='replace').strip()
         except Exception as e:
             print(f"  [WARN] Could not read {filename}: {e}")
-            
-    return "\n\n".join(content_parts)
+            read_failed = True
+            continue
+
+        if not text:
+            continue
+
+        # Same header as the per-section queries in extract_results
+        header = f"\n--- Section: {os.path.splitext(filename)[0]} ---\n"
+
+        # Truncate if this file pushes over the edge
+        remaining_space = MAX_CHARS_PER_PAPER - current_length
+        if len(text) > remaining_space:
+            text = text[:remaining_space] + "\n[... truncated ...]"
+
+        content_parts.append(header + text)
+        current_length += len(header) + len(text)
+
+        # Stop as soon as the cap is reached rather than opening the next file
+        if current_length >= MAX_CHARS_PER_PAPER:
+            break
+
+    content = "\n\n".join(content_parts)
+
+    # Don't cache partial content, so read errors are reported again next run
+    if not read_failed:
+        write_content_cache(paper_path, cache_file, content, cache_tag)
+
+    return content
+
+def content_cache_key(sorted_files):
+    """Fingerprint section files by name, mtime and size (plus the cache version and length cap)."""
+    h = hashlib.blake2b(f"{CONTENT_CACHE_VERSION}:{MAX_CHARS_PER_PAPER}".encode(), digest_size=8)
+    for p in sorted_files:
+        st = p.stat()
+        h.update(f"{p.name}:{st.st_mtime_ns}:{st.st_size}\n".encode())
+    return h.hexdigest()
+
+def write_content_cache(paper_path, cache_file, content, cache_tag):
+    """Atomically write the content cache and drop stale cache files of the same subset."""
+    try:
+        tmp_file = cache_file.with_name(cache_file.name + ".tmp")
+        tmp_file.write_text(content, encoding='utf-8')
+        os.replace(tmp_file, cache_file)
+        for stale in paper_path.glob(f"{CONTENT_CACHE_PREFIX}{cache_tag}_*"):
+            if stale != cache_file:
+                stale.unlink()
+    except Exception as e:
+        print(f"  [WARN] Could not write cache {cache_file.name}: {e}")
 
 def find_papers(papers_dir):
     """Find all paper directories."""
@@ -85,103 +203,348 @@ def find_papers(papers_dir):
             
     return papers
 
+def build_paper_block(paper_id, paper_text):
+    """Build the paper-specific part of the user prompt."""
+    return f"""Paper: '{paper_id}'
+
+Paper Content:
+{paper_text}
+
+Tables:"""
+
+def build_prompt(paper_id, paper_text):
+    """Build the user prompt asking for the result tables of one paper."""
+    # Static instructions first so every request shares the same prefix
+    return f"{RESULTS_INSTRUCTIONS}\n\n{build_paper_block(paper_id, paper_text)}"
+
+def format_result(result):
+    """Format one paper's tables for the output file; empty for papers without results."""
+    results_text = result['results']
+    # Filter out empty results to keep output clean
+    if results_text == "NO_RESULTS_FOUND":
+        return ""
+
+    return (f"Paper: {result['paper_id']}\n"
+            + "=" * 80 + "\n"
+            + f"{results_text}\n"
+            + "=" * 80 + "\n\n")
+
+def save_results(all_results, output_file):
+    """Write extracted tables to the output file, skipping papers without results."""
+    with open(output_file, 'w', encoding='utf-8') as f:
+        for result in all_results:
+            f.write(format_result(result))
+
+    print(f"\n[OK] Results saved to {output_file}")
+
+class AdaptiveLimiter:
+    """
+    Async concurrency limit that adapts to rate limiting.
+    After every `window` finished queries, the limit halves if more than
+    `threshold` of them were rate limited, and doubles (up to max_limit) otherwise.
+    """
+
+    def __init__(self, max_limit, window=10, threshold=0.1):
+        self.max_limit = max(1, max_limit)
+        self.limit = self.max_limit
+        self.window = window
+        self.threshold = threshold
+        self._active = 0
+        self._finished = 0
+        self._rate_limited = 0
+        self._cond = asyncio.Condition()
+
+    async def __aenter__(self):
+        async with self._cond:
+            await self._cond.wait_for(lambda: self._active < self.limit)
+            self._active += 1
+
+    async def __aexit__(self, exc_type, exc, tb):
+        async with self._cond:
+            self._active -= 1
+            self._cond.notify_all()
+
+    async def record(self, rate_limited):
+        """Record the outcome of one query and adjust the limit at the end of a window."""
+        async with self._cond:
+            self._finished += 1
+            self._rate_limited += rate_limited
+            if self._finished < self.window:
+                return
+
+            old_limit = self.limit
+            if self._rate_limited / self._finished > self.threshold:
+                self.limit = max(1, self.limit // 2)
+            else:
+                self.limit = min(self.max_limit, self.limit * 2)
+            self._finished = self._rate_limited = 0
+
+            if self.limit != old_limit:
+                print(f"  [INFO] Concurrency limit {old_limit} -> {self.limit}")
+                self._cond.notify_all()
+
+async def query_with_retries(prompt, options, limiter, label):
+    """Run one Claude query, retrying transient failures with jittered exponential backoff."""
+    for attempt in range(1, MAX_RETRIES + 1):
+        try:
+            async with limiter:
+                print(f"  [BUSY] {label}: Querying Claude... (Attempt {attempt}/{MAX_RETRIES})")
+                text = ""
+                async for message in query(prompt=prompt, options=options):
+                    if hasattr(message, 'content'):
+                        for block in message.content:
+                            if hasattr(block, 'text'):
+                                text += block.text
+            text = text.strip()
+
+            # Rate-limit notices can come back as ordinary response text
+            if RATE_LIMIT_REPLY_RE.match(text):
+                raise RuntimeError(f"Rate limited: {text[:200]}")
+
+            await limiter.record(rate_limited=False)
+            return text
+
+        except Exception as query_error:
+            reason = f"{type(query_error).__name__}: {query_error}"
+            await limiter.record(rate_limited=bool(RATE_LIMIT_RE.search(reason)))
+            if attempt == MAX_RETRIES or not TRANSIENT_ERROR_RE.search(reason):
+                raise
+
+            # Full jitter keeps retrying papers from hitting the API in lockstep
+            delay = random.uniform(RETRY_MIN_DELAY, min(RETRY_MAX_DELAY, RETRY_MIN_DELAY * 2 ** attempt))
+            print(f"    [WARN] {label}: {reason}. Retrying in {delay:.1f}s...")
+            await asyncio.sleep(delay)
+
+async def query_sections(paper_id, sections, options, limiter):
+    """
+    Query each (label, paper_text) part of one paper concurrently and merge the tables.
+    Failed parts are recorded inline as ERROR entries, so a partial result is never
+    mistaken for a complete one. Returns NO_RESULTS_FOUND only if every query succeeded
+    without results; raises if every query failed.
+    """
+    section_sem = asyncio.Semaphore(SECTION_CONCURRENCY)
+
+    async def query_one(name, text):
+        async with section_sem:
+            prompt = build_prompt(paper_id, text)
+            return await query_with_retries(prompt, options, limiter, f"{paper_id} [{name}]")
+
+    outputs = await asyncio.gather(*(query_one(name, text) for name, text in sections),
+                                   return_exceptions=True)
+
+    merged = []
+    errors = []
+    for (name, _), output in zip(sections, outputs):
+        if isinstance(output, Exception):
+            print(f"    [WARN] {paper_id} [{name}]: {type(output).__name__}: {output}")
+            errors.append(output)
+            merged.append(f"## {name}\nERROR: {output}")
+        elif output and output != "NO_RESULTS_FOUND":
+            merged.append(f"## {name}\n{output}")
+
+    if errors and len(errors) == len(sections):
+        raise errors[0]
+
+    return "\n\n".join(merged) if merged else "NO_RESULTS_FOUND"
+
 async def extract_results(papers, output_file):
     """Extract results from papers using Claude Agent SDK."""
 
     # Configure options for the SDK
     options = ClaudeAgentOptions(
-        system_prompt='''You are an expert researcher tasked with extracting experimental results from scientific papers.
-Your goal is to ONE THING ONLY: Extract tables containing experimental results.
-
-Instructions:
-1.  **Output ONLY the tables.** Do not include any introductory text, explanations, or conclusions.
-2.  Format specific tables as Markdown tables.
-3.  If a result is presented as a list of key metrics instead of a table, format it as a table with columns "Metric" and "Value".
-4.  If no experimental results are found, output the string "NO_RESULTS_FOUND".
-5.  Do not output "Here are the results..." or "Based on the paper...". Start directly with the Markdown table.
-''',
+        system_prompt=SYSTEM_PROMPT,
         model='sonnet' # Use sonnet for better reasoning capabilities
     )
 
-    all_results = []
+    # Bound the papers being worked on, so only that many have their text
+    # assembled and held in memory at once
+    papers_concurrency = max(1, int(os.getenv("PAPERS_CONCURRENCY", "8")))
+    paper_sem = asyncio.Semaphore(papers_concurrency)
+
+    # Bound the number of queries in flight; shrinks while rate limits spike
+    limiter = AdaptiveLimiter(papers_concurrency)
+
+    # Results are appended as soon as every earlier paper has finished, so the file
+    # stays in paper order and a crash keeps a finished prefix; file writes run in a
+    # worker thread to keep the event loop free
+    out = open(output_file, 'w', encoding='utf-8')
+    write_lock = asyncio.Lock()
+    # Formatted text of finished papers still waiting on an earlier paper, by index
+    pending = {}
+    next_index = 1
 
-    for i, paper_dir in enumerate(papers, 1):
+    def write_and_flush(text):
+        out.write(text)
+        out.flush()
+
+    async def save(i, result):
+        nonlocal next_index
+        async with write_lock:
+            pending[i] = format_result(result) if result else ""
+            ready = []
+            while next_index in pending:
+                ready.append(pending.pop(next_index))
+                next_index += 1
+            text = "".join(ready)
+            if text:
+                await asyncio.to_thread(write_and_flush, text)
+
+    async def process_paper(i, paper_dir):
         paper_id = paper_dir.name.replace("_sections", "")
         print(f"Processing {i}/{len(papers)}: {paper_id}")
 
         try:
-            # Aggregate paper content
-            paper_text = get_paper_content(paper_dir)
-            
-            if not paper_text:
-                print(f"  [SKIP] No relevant content found for {paper_id}")
-                continue
+            # Files are sorted by score, so the result-bearing sections come first
+            files = list_section_files(paper_dir)
+            n_top = 0
+            while n_top < len(files) and get_weighted_score(files[n_top].name) <= SECTION_QUERY_MAX_SCORE:
+                n_top += 1
 
-            # Create the prompt
-            prompt = f"""Find and format all experimental result tables from the following content on paper '{paper_id}'.
-Preserve the exact numbers.
+            # Query result-bearing sections one by one so late tables aren't cut off
+            sections = [(name, f"\n--- Section: {name} ---\n{text}")
+                        for name, text in iter_sections(files[:n_top])]
 
-Paper Content:
-{paper_text}
+            if sections:
+                # Everything else (discussion, ablations, appendices) goes in one extra query
+                other_files = files[n_top:]
+                other_text = get_paper_content(paper_dir, other_files, "other") if other_files else ""
+                if other_text:
+                    sections.append(("other sections", other_text))
+                extracted_info = await query_sections(paper_id, sections, options, limiter)
+            else:
+                # No result-like sections; fall back to one query over the whole paper
+                paper_text = get_paper_content(paper_dir, files)
 
-Tables:"""
+                if not paper_text:
+                    print(f"  [SKIP] No relevant content found for {paper_id}")
+                    return None
 
-            # Query Claude with retries
-            extracted_info = ""
-            max_retries = 3
-            retry_delay = 2
-            
-            for attempt in range(max_retries):
-                try:
-                    print(f"  [BUSY] Querying Claude... (Attempt {attempt+1}/{max_retries})")
-                    extracted_info = "" # Reset
-                    async for message in query(prompt=prompt, options=options):
-                        if hasattr(message, 'content'):
-                            for block in message.content:
-                                if hasattr(block, 'text'):
-                                    extracted_info += block.text
-                    break # Success
-                except Exception as query_error:
-                    if "Claude Code not found" in str(query_error) and attempt < max_retries - 1:
-                        print(f"    [WARN] SDK Error: {query_error}. Retrying in {retry_delay}s...")
-                        await asyncio.sleep(retry_delay)
-                        retry_delay *= 2
-                    else:
-                        raise query_error # Re-raise to be caught by outer try/except
-            
-            extracted_info = extracted_info.strip()
-            
-            all_results.append({
+                # Create the prompt
+                prompt = build_prompt(paper_id, paper_text)
+
+                # Query Claude with retries
+                extracted_info = await query_with_retries(prompt, options, limiter, paper_id)
+
+            print(f"  [OK] {paper_id}: Extracted {len(extracted_info)} characters.")
+
+            return {
                 "paper_id": paper_id,
                 "results": extracted_info
-            })
-
-            print(f"  [OK] Extracted {len(extracted_info)} characters.")
+            }
 
         except Exception as e:
-            print(f"  [ERROR] {e}")
-            all_results.append({
+            print(f"  [ERROR] {paper_id}: {type(e).__name__}: {e}")
+            return {
                 "paper_id": paper_id,
                 "results": f"ERROR: {str(e)}"
-            })
+            }
 
-    # Save results to text file
-    with open(output_file, 'w', encoding='utf-8') as f:
-        for result in all_results:
-            results_text = result['results']
-            # Filter out empty results to keep output clean
-            if results_text == "NO_RESULTS_FOUND":
-                continue
-                
-            f.write(f"Paper: {result['paper_id']}\n")
-            f.write("=" * 80 + "\n")
-            f.write(f"{results_text}\n")
-            f.write("=" * 80 + "\n\n")
+    async def process(i, paper_dir):
+        async with paper_sem:
+            result = await process_paper(i, paper_dir)
+        await save(i, result)
+        return result
+
+    # Fan out all papers; the returned list keeps paper order. Let every task
+    # finish before closing the file, then re-raise the first failure (e.g. a failed write)
+    try:
+        outcomes = await asyncio.gather(*(process(i, p) for i, p in enumerate(papers, 1)),
+                                        return_exceptions=True)
+    finally:
+        out.close()
+    for outcome in outcomes:
+        if isinstance(outcome, BaseException):
+            raise outcome
+    all_results = [r for r in outcomes if r is not None]
 
     print(f"\n[OK] Results saved to {output_file}")
     return all_results
 
+async def extract_results_batch(papers, output_file):
+    """Extract results from papers with one Anthropic Message Batch."""
+    try:
+        from anthropic import AsyncAnthropic
+    except Exception as exc:
+        raise SystemExit("anthropic is required for --batch. Install with: pip install anthropic") from exc
+
+    client = AsyncAnthropic()
+
+    # custom_id only allows [a-zA-Z0-9_-], so key requests by index
+    paper_ids = {}
+    requests = []
+    for i, paper_dir in enumerate(papers):
+        paper_id = paper_dir.name.replace("_sections", "")
+        paper_text = get_paper_content(paper_dir)
+        if not paper_text:
+            print(f"  [SKIP] No relevant content found for {paper_id}")
+            continue
+
+        custom_id = f"paper-{i}"
+        paper_ids[custom_id] = paper_id
+        requests.append({
+            "custom_id": custom_id,
+            "params": {
+                "model": BATCH_MODEL,
+                "max_tokens": BATCH_MAX_TOKENS,
+                "system": SYSTEM_PROMPT,
+                "messages": [{
+                    "role": "user",
+                    "content": [
+                        # Marks the system prompt and instructions as a cacheable prefix. It only
+                        # takes effect once that prefix grows past the model's minimum (1024 tokens)
+                        {"type": "text", "text": RESULTS_INSTRUCTIONS, "cache_control": {"type": "ephemeral"}},
+                        {"type": "text", "text": build_paper_block(paper_id, paper_text)},
+                    ],
+                }],
+            },
+        })
+
+    if not requests:
+        print("No papers with relevant content!")
+        return []
+
+    batch = await client.messages.batches.create(requests=requests)
+    print(f"Submitted batch {batch.id} with {len(requests)} papers")
+
+    while batch.processing_status != "ended":
+        await asyncio.sleep(BATCH_POLL_SECONDS)
+        batch = await client.messages.batches.retrieve(batch.id)
+        counts = batch.request_counts
+        print(f"  [BUSY] {counts.processing} processing, {counts.succeeded} succeeded, {counts.errored} errored")
+
+    extracted = {}
+    async for entry in await client.messages.batches.results(batch.id):
+        paper_id = paper_ids[entry.custom_id]
+        if entry.result.type == "succeeded":
+            text = "".join(block.text for block in entry.result.message.content if hasattr(block, 'text'))
+            extracted[entry.custom_id] = text.strip()
+            print(f"  [OK] {paper_id}: Extracted {len(extracted[entry.custom_id])} characters.")
+        else:
+            error = getattr(entry.result, 'error', None) or entry.result.type
+            extracted[entry.custom_id] = f"ERROR: {error}"
+            print(f"  [ERROR] {paper_id}: {error}")
+
+    # Keep paper order in the output
+    all_results = [
+        {"paper_id": paper_ids[custom_id], "results": extracted.get(custom_id, "ERROR: missing from batch results")}
+        for custom_id in paper_ids
+    ]
+
+    save_results(all_results, output_file)
+    return all_results
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Extract result tables from paper sections.")
+    parser.add_argument(
+        "--batch",
+        action="store_true",
+        help="Submit all papers as one Anthropic Message Batch instead of querying interactively",
+    )
+    return parser.parse_args()
+
 async def main():
+    args = parse_args()
+
     # Configuration
     papers_dir = "paper_sections"
     output_file = "paper_results.txt"
@@ -201,7 +564,10 @@ async def main():
         return
 
     # Extract results
-    await extract_results(papers, output_file)
+    if args.batch:
+        await extract_results_batch(papers, output_file)
+    else:
+        await extract_results(papers, output_file)
 
 if __name__ == "__main__":
     asyncio.run(main())
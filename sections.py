@@ -1,48 +1,65 @@
+import os
 import re
+from concurrent.futures import ProcessPoolExecutor
 from pathlib import Path
 
+_PAGE_RE = re.compile(r'_page_(\d+)\.txt$')
+_ABSTRACT_RE = re.compile(r'^Abstract[\s.\-—]')
+_ABSTRACT_SUB_RE = re.compile(r'^Abstract[\s.\-—]+')
+_SECNUM_RE = re.compile(r'^(\d+)\.?\s*(.+)')
+_BADCHARS_RE = re.compile(r'[<>:"/\\|?*]')
+
+def iter_lines(files):
+    """Yield the lines of files in order, as '\n'.join of their contents split on '\n' would."""
+    for f in files:
+        print(f"  {f.name}")
+        # An empty file, or one ending in a newline, contributes a trailing empty line
+        ends_with_newline = True
+        with open(f, encoding='utf-8') as fh:
+            for line in fh:
+                ends_with_newline = line.endswith('\n')
+                yield line[:-1] if ends_with_newline else line
+        if ends_with_newline:
+            yield ''
+
 def combine_files(folder):
-    """Combine text files sorted by page number."""
+    """Combine text files sorted by page number into a lazy stream of lines."""
     path = Path(folder)
     if not path.exists():
         print(f"Error: {folder} does not exist")
         return None, None
 
     files = sorted(path.glob("*.txt"),
-                   key=lambda f: int(m.group(1)) if (m := re.search(r'_page_(\d+)\.txt$', str(f))) else 0)
+                   key=lambda f: int(m.group(1)) if (m := _PAGE_RE.search(str(f))) else 0)
 
     if not files:
         print(f"No .txt files in {folder}")
         return None, None
 
     print(f"Combining {len(files)} files...")
-    content = []
-    for f in files:
-        print(f"  {f.name}")
-        content.append(f.read_text(encoding='utf-8'))
+    return iter_lines(files), path.name
 
-    return '\n'.join(content), path.name
-
-def extract_sections(content, name):
-    """Extract sections starting with ## to separate files."""
-    if not content:
-        return
+def extract_sections(lines, name):
+    """Extract sections starting with ## to separate files. Returns the number of sections."""
+    if not lines:
+        return 0
 
     sections = []
     current = {"title": "", "content": []}
 
-    for line in content.split('\n'):
+    for line in lines:
+        stripped = line.strip()
         # Check for ## section headers
-        if line.strip().startswith('##'):
+        if stripped.startswith('##'):
             if current["title"] or current["content"]:
                 sections.append(current)
-            current = {"title": line.strip().lstrip('#').strip(), "content": []}
+            current = {"title": stripped.lstrip('#').strip(), "content": []}
         # Check for Abstract without ## marker (e.g., "Abstract." or "Abstract—" or "Abstract ")
-        elif re.match(r'^Abstract[\s.\-—]', line.strip()):
+        elif _ABSTRACT_RE.match(stripped):
             if current["title"] or current["content"]:
                 sections.append(current)
             # Extract abstract content after the marker
-            abstract_content = re.sub(r'^Abstract[\s.\-—]+', '', line.strip())
+            abstract_content = _ABSTRACT_SUB_RE.sub('', stripped)
             current = {"title": "Abstract", "content": [abstract_content] if abstract_content else []}
         else:
             current["content"].append(line)
@@ -63,7 +80,7 @@ def extract_sections(content, name):
     for i, sec in enumerate(sections, 1):
         if sec["title"]:
             # Extract original section number
-            num_match = re.match(r'^(\d+)\.?\s*(.+)', sec["title"])
+            num_match = _SECNUM_RE.match(sec["title"])
             if num_match:
                 orig_num = num_match.group(1)
                 clean_title = num_match.group(2)
@@ -75,7 +92,7 @@ def extract_sections(content, name):
                 else:
                     orig_num = None  # No number for other unnumbered sections
 
-            filename = re.sub(r'[<>:"/\\|?*]', '_', clean_title)[:100]
+            filename = _BADCHARS_RE.sub('_', clean_title)[:100]
             if orig_num:
                 out_file = out_dir / f"{orig_num}_{filename}.txt"
                 display = f"{orig_num}_{filename}"
@@ -91,6 +108,15 @@ def extract_sections(content, name):
             out_file.write_text(text, encoding='utf-8')
             print(f"  {display}")
 
+    return len(sections)
+
+def process_folder(folder):
+    """Combine one paper folder's pages and split them into section files."""
+    content, name = combine_files(folder)
+    if not content:
+        return folder.name, 0
+    return folder.name, extract_sections(content, name)
+
 def get_all_folders(base="batch_output_FINAL"):
     """Get all paper folders in the base directory."""
     base_path = Path(base)
@@ -114,16 +140,10 @@ if __name__ == "__main__":
         print(f"Found {len(folders)} papers to process\n")
         print("=" * 80)
 
-        for idx, folder in enumerate(folders, 1):
-            print(f"\n[{idx}/{len(folders)}] Processing: {folder.name}")
-            print("-" * 80)
-
-            content, name = combine_files(folder)
-            if content:
-                print("=" * 80)
-                extract_sections(content, name)
-
-            print()
+        # Folders are independent, so split them across worker processes
+        with ProcessPoolExecutor(max_workers=os.cpu_count()) as ex:
+            for idx, (name, num_sections) in enumerate(ex.map(process_folder, folders, chunksize=4), 1):
+                print(f"[{idx}/{len(folders)}] {name}: {num_sections} sections")
 
         print("\n" + "=" * 80)
         print(f"Completed processing {len(folders)} papers")
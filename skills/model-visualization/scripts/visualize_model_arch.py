@@ -1,3 +1,4 @@
+import functools
 import os
 import sys
 from typing import Any, Dict, Tuple
@@ -9,6 +10,9 @@ try:
 except Exception as exc:
     raise SystemExit("PyYAML is required. Install with: pip install pyyaml") from exc
 
+# Prefer the libyaml-backed loader; fall back to the pure-Python one
+YamlLoader = getattr(yaml, "CSafeLoader", yaml.SafeLoader)
+
 try:
     from graphviz import Digraph  # Python package; requires Graphviz binaries installed
 except Exception as exc:
@@ -22,8 +26,14 @@ from model.architecture.model_transformer import TransformerModel
 def load_yaml_config(config_path: str) -> Dict[str, Any]:
     if not os.path.isfile(config_path):
         raise FileNotFoundError(f"Config file not found: {config_path}")
+    # Include the mtime in the cache key so an edited config is re-read
+    return _load_yaml_cached(os.path.abspath(config_path), os.stat(config_path).st_mtime_ns)
+
+
+@functools.lru_cache(maxsize=8)
+def _load_yaml_cached(config_path: str, mtime_ns: int) -> Dict[str, Any]:
     with open(config_path, "r", encoding="utf-8") as f:
-        return yaml.safe_load(f)
+        return yaml.load(f, Loader=YamlLoader)
 
 
 def compute_vocab_size(cfg: Dict[str, Any]) -> int:
@@ -51,10 +61,32 @@ def build_model_from_cfg(cfg: Dict[str, Any]) -> TransformerModel:
     )
 
 
-def _count_params(module: torch.nn.Module) -> Tuple[int, int]:
-    total = sum(p.numel() for p in module.parameters())
-    trainable = sum(p.numel() for p in module.parameters() if p.requires_grad)
-    return total, trainable
+def _count_params_tree(root: torch.nn.Module) -> Dict[int, Tuple[int, int]]:
+    """Return (total, trainable) parameter counts for every module under root, keyed by id(module).
+
+    Walks the tree once, building each node's counts from its children instead of
+    re-iterating module.parameters() per node. Parameters shared between submodules
+    (e.g. tied embeddings) are counted once, as module.parameters() would.
+    """
+    counts: Dict[int, Tuple[int, int]] = {}
+
+    def visit(module: torch.nn.Module) -> Tuple[Dict[int, torch.nn.Parameter], int, int]:
+        parts = sorted((visit(child) for child in module.children()), key=lambda part: len(part[0]), reverse=True)
+        # Merge smaller children into the largest child's parameter map
+        params, total, trainable = parts[0] if parts else ({}, 0, 0)
+        new_params = [p for part in parts[1:] for p in part[0].values()]
+        new_params.extend(module.parameters(recurse=False))
+        for p in new_params:
+            if id(p) not in params:
+                params[id(p)] = p
+                total += p.numel()
+                if p.requires_grad:
+                    trainable += p.numel()
+        counts[id(module)] = (total, trainable)
+        return params, total, trainable
+
+    visit(root)
+    return counts
 
 
 def render_full_architecture_png(model: TransformerModel, out_path_png: str) -> str:
@@ -65,8 +97,11 @@ def render_full_architecture_png(model: TransformerModel, out_path_png: str) ->
     dot = Digraph(comment="Transformer Full Architecture", format="png")
     dot.attr(rankdir="LR")
 
+    # Parameter counts for every submodule in one pass
+    counts = _count_params_tree(model)
+
     # Root node
-    total, trainable = _count_params(model)
+    total, trainable = counts[id(model)]
     root_name = "model"
     root_label = f"{root_name}{model.__class__.__name__}\\nparams: {total:,} ({trainable:,} trainable)"
     dot.node(root_name, label=root_label, shape="box")
@@ -81,7 +116,7 @@ def render_full_architecture_png(model: TransformerModel, out_path_png: str) ->
     }
 
     for child_name, child in children.items():
-        ctot, ctrain = _count_params(child)
+        ctot, ctrain = counts[id(child)]
         label = f"model.{child_name}{child.__class__.__name__}\\nparams: {ctot:,} ({ctrain:,} trainable)"
         dot.node(f"model.{child_name}", label=label, shape="box")
         dot.edge(root_name, f"model.{child_name}")
@@ -90,14 +125,14 @@ def render_full_architecture_png(model: TransformerModel, out_path_png: str) ->
     if hasattr(model.transformer, "layers"):
         layers = list(model.transformer.layers)
         for idx, layer in enumerate(layers):
-            ltot, ltrain = _count_params(layer)
+            ltot, ltrain = counts[id(layer)]
             lname = f"model.transformer.layers.{idx}"
             llabel = f"{lname}{layer.__class__.__name__}\\nparams: {ltot:,} ({ltrain:,} trainable)"
             dot.node(lname, label=llabel, shape="box")
             dot.edge("model.transformer.layers", lname)
 
         # Add aggregate node for ModuleList similar to screenshot
-        mltot, mltrain = _count_params(model.transformer.layers)
+        mltot, mltrain = counts[id(model.transformer.layers)]
         mlname = "model.transformer.layers"
         mllabel = f"{mlname}ModuleList\\nparams: {mltot:,} ({mltrain:,} trainable)"
         dot.node(mlname, label=mllabel, shape="box")
